@@ -0,0 +1,161 @@
+# test_trace_tree.py
+import os
+import json
+
+import numpy as np
+
+from classify import group_by_parent
+from trace_tree import build_trace_tree, critical_path, sibling_sweep, analyze_trace
+
+TEST_TRACE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          "..", "test_files", "0cbd7cf97e025fdf.json")
+
+
+def span(name, start, duration, parent=None):
+    s = {"spanID": name, "operationName": name, "startTime": start,
+         "duration": duration, "references": []}
+    if parent:
+        s["references"].append({"refType": "CHILD_OF", "spanID": parent})
+    return s
+
+
+def sweep(spans):
+    """Run the sweep and return (tree, peak by parent id, blocking/busy by name)."""
+    tree = build_trace_tree(spans)
+    peak, blocking, busy = sibling_sweep(tree)
+    ids = tree['span_ids']
+    peak_by_pid = {}
+    for s in spans:
+        if s["references"]:
+            k = tree['parent_key'][ids.index(s["spanID"])]
+            peak_by_pid[s["references"][0]["spanID"]] = peak[k]
+    return (tree, peak_by_pid,
+            dict(zip(ids, blocking.tolist())), dict(zip(ids, busy.tolist())))
+
+
+def path_names(tree, root=None):
+    return [tree['span_ids'][i] for i in critical_path(tree, root)]
+
+
+def test_sequential_touching_siblings():
+    spans = [span("P", 0, 100), span("A", 0, 30, "P"),
+             span("B", 30, 30, "P"), span("C", 60, 40, "P")]
+    tree, peak, blocking, busy = sweep(spans)
+    # touching intervals are not concurrent
+    assert peak == {"P": 1}
+    assert blocking == {"P": 0, "A": 30, "B": 30, "C": 40}
+    assert path_names(tree) == ["P", "A", "B", "C"]
+
+
+def test_overlapping_siblings():
+    spans = [span("P", 0, 100), span("A", 0, 60, "P"), span("B", 40, 60, "P")]
+    tree, peak, blocking, busy = sweep(spans)
+    assert peak == {"P": 2}
+    assert blocking == {"P": 0, "A": 40, "B": 40}
+    assert path_names(tree) == ["P", "A", "B"]
+
+
+def test_zero_duration_span():
+    spans = [span("P", 0, 100), span("A", 0, 50, "P"), span("Z", 20, 0, "P")]
+    tree, peak, blocking, busy = sweep(spans)
+    assert peak == {"P": 1}
+    assert blocking == {"P": 0, "A": 50, "Z": 0}
+    assert path_names(tree) == ["P", "A"]
+
+
+def test_only_zero_length_children():
+    spans = [span("P", 0, 100), span("Z", 10, 0, "P")]
+    tree, peak, blocking, busy = sweep(spans)
+    assert peak == {"P": 1}
+    assert blocking == {"P": 0, "Z": 0}
+
+
+def test_child_outside_parent():
+    spans = [span("P", 0, 100), span("L", 200, 50, "P")]
+    tree, peak, blocking, busy = sweep(spans)
+    assert peak == {"P": 1}
+    assert busy["L"] == 0
+    assert blocking["L"] == 0
+
+
+def test_missing_parent_groups_roots():
+    spans = [span("A", 0, 10, "ghost"), span("B", 5, 10, "ghost")]
+    tree, peak, blocking, busy = sweep(spans)
+    assert list(tree['parent']) == [-1, -1]
+    assert list(tree['depth']) == [0, 0]
+    assert peak == {"ghost": 2}
+    # no parent interval to clip against
+    assert blocking == {"A": 5, "B": 5}
+    assert busy == {"A": 10, "B": 10}
+
+
+def test_child_overrunning_parent():
+    spans = [span("R", 0, 100), span("C", 50, 150, "R"), span("X", 150, 50, "C")]
+    tree, peak, blocking, busy = sweep(spans)
+    assert busy["C"] == 50
+    assert blocking["C"] == 50
+    # X ran after R finished, so it is not on R's critical path
+    assert path_names(tree) == ["R", "C"]
+
+
+def test_critical_path_skips_grandchild_of_displaced_child():
+    spans = [span("R", 0, 100), span("A", 0, 60, "R"),
+             span("B", 40, 60, "R"), span("G", 50, 10, "A")]
+    tree = build_trace_tree(spans)
+    # G ran while B was critical
+    assert path_names(tree) == ["R", "A", "B"]
+
+
+def test_critical_path_wide_fan_out():
+    n = 20000
+    spans = [span("P", 0, n)] + [span(f"c{i}", i, 1, "P") for i in range(n)]
+    tree = build_trace_tree(spans)
+    assert len(critical_path(tree)) == n + 1
+
+
+def test_euler_tour_subtrees():
+    spans = [span("r", 0, 100), span("a", 0, 30, "r"), span("b", 10, 50, "r"),
+             span("c", 60, 40, "r"), span("d", 20, 30, "b")]
+    tree = build_trace_tree(spans)
+    assert list(tree['depth']) == [0, 1, 1, 1, 2]
+    b = tree['span_ids'].index("b")
+    subtree = tree['order'][tree['tin'][b]:tree['tout'][b]]
+    assert sorted(tree['span_ids'][i] for i in subtree) == ["b", "d"]
+
+
+def test_parent_cycle_becomes_extra_root():
+    spans = [span("R", 0, 100), span("A", 10, 20, "B"), span("B", 5, 40, "A")]
+    tree = build_trace_tree(spans)
+    assert sorted(tree['order']) == [0, 1, 2]
+    assert all(tree['tin'] >= 0)
+    # the cycle is cut at B, where the walk from the earliest unreached span
+    # first comes back to itself
+    a, b = tree['span_ids'].index("A"), tree['span_ids'].index("B")
+    assert tree['parent'][b] == -1 and tree['parent'][a] == b
+    assert list(tree['depth']) == [0, 1, 0]
+    subtree = tree['order'][tree['tin'][b]:tree['tout'][b]]
+    assert sorted(tree['span_ids'][i] for i in subtree) == ["A", "B"]
+
+
+def test_malformed_spans_are_skipped():
+    spans = [span("P", 0, 100), {"spanID": "bad", "startTime": "x"},
+             span("A", 0, 10, "P")]
+    result = analyze_trace(spans)
+    assert result['tree']['span_ids'] == ["P", "A"]
+    assert result['critical_path'] == ["P", "A"]
+
+
+def test_parent_key_matches_group_by_parent():
+    with open(TEST_TRACE) as f:
+        traces = json.load(f)["data"]
+    for trace in traces:
+        spans = trace["spans"]
+        tree = build_trace_tree(spans)
+        expected = {frozenset(s["spanID"] for s in sibs)
+                    for sibs in group_by_parent(spans).values()}
+        groups = {}
+        for sid, k in zip(tree['span_ids'], tree['parent_key']):
+            if k >= 0:
+                groups.setdefault(k, set()).add(sid)
+        assert {frozenset(g) for g in groups.values()} == expected
+        assert np.array_equal(np.sort(tree['order']), np.arange(len(spans)))
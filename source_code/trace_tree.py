@@ -0,0 +1,304 @@
+# trace_tree.py
+import os
+import json
+from collections import defaultdict
+
+import numpy as np
+from tqdm import tqdm  # optional, for progress bar
+
+from classify import get_parent_id
+
+
+def build_trace_tree(spans):
+    """
+    Index one trace's spans as a tree of numpy arrays.
+
+    Spans are numbered 0..n-1 in input order; malformed spans (missing or
+    non-numeric times) are skipped, as in `classify_siblings`. Children are
+    stored CSR-style: the children of span i are
+    child_idx[child_ptr[i]:child_ptr[i+1]], sorted by start time. `order` is
+    the pre-order (Euler tour) walk, and the subtree of span i is
+    order[tin[i]:tout[i]]. Spans whose parent is not in the trace are roots
+    (parent == -1); `parent_key` still groups them by the parent ID they
+    reference, so siblings match `group_by_parent`. A malformed trace whose
+    parent links form a cycle is cut at one span of the cycle, which becomes
+    an extra root, so every span is in `order`.
+    """
+    starts, ends, ops, span_ids, parent_ids = [], [], [], [], []
+    for s in spans:
+        try:
+            st = float(s["startTime"])
+            en = st + float(s.get("duration", 0.0))
+            pid = get_parent_id(s)
+        except (KeyError, ValueError, TypeError, AttributeError):
+            continue
+        starts.append(st)
+        ends.append(en)
+        ops.append(s.get("operationName", s.get("spanID")))
+        span_ids.append(s.get("spanID"))
+        parent_ids.append(pid)
+    n = len(span_ids)
+    start = np.array(starts, dtype=float)
+    end = np.array(ends, dtype=float)
+
+    index_of = {sid: i for i, sid in enumerate(span_ids)}
+    key_of = {}
+    parent = np.full(n, -1, dtype=np.int64)
+    parent_key = np.full(n, -1, dtype=np.int64)
+    for i, pid in enumerate(parent_ids):
+        if not pid:
+            continue
+        parent_key[i] = key_of.setdefault(pid, len(key_of))
+        j = index_of.get(pid, -1)
+        if j != i:
+            parent[i] = j
+
+    while True:
+        # CSR child arrays: group by parent, order siblings by start time
+        has_parent = np.flatnonzero(parent >= 0)
+        child_idx = has_parent[np.lexsort((start[has_parent], parent[has_parent]))]
+        counts = np.bincount(parent[has_parent], minlength=n)
+        child_ptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(counts, out=child_ptr[1:])
+
+        # single iterative DFS for depth and Euler-tour order
+        roots = np.flatnonzero(parent < 0)
+        roots = roots[np.argsort(start[roots], kind="stable")]
+        depth = np.zeros(n, dtype=np.int64)
+        tin = np.full(n, -1, dtype=np.int64)
+        tout = np.full(n, -1, dtype=np.int64)
+        order = []
+        stack = [(int(r), False) for r in roots[::-1]]
+        while stack:
+            i, done = stack.pop()
+            if done:
+                tout[i] = len(order)
+                continue
+            tin[i] = len(order)
+            order.append(i)
+            stack.append((i, True))
+            kids = child_idx[child_ptr[i]:child_ptr[i + 1]]
+            depth[kids] = depth[i] + 1
+            stack.extend((int(c), False) for c in kids[::-1])
+
+        unreached = np.flatnonzero(tin < 0)
+        if len(unreached) == 0:
+            break
+        # only parent cycles are unreachable from a root: follow parents from
+        # the earliest unreached span into its cycle and cut it there
+        i = int(unreached[np.argmin(start[unreached])])
+        seen = set()
+        while i not in seen:
+            seen.add(i)
+            i = int(parent[i])
+        parent[i] = -1
+
+    return {
+        'span_ids':   span_ids,
+        'ops':        np.array(ops, dtype=object),
+        'start':      start,
+        'end':        end,
+        'parent':     parent,
+        'parent_key': parent_key,
+        'child_ptr':  child_ptr,
+        'child_idx':  child_idx,
+        'depth':      depth,
+        'order':      np.array(order, dtype=np.int64),
+        'tin':        tin,
+        'tout':       tout,
+        'roots':      roots,
+    }
+
+
+def children_of(tree, i):
+    return tree['child_idx'][tree['child_ptr'][i]:tree['child_ptr'][i + 1]]
+
+
+def critical_path(tree, root=None):
+    """
+    Return the span indices on the critical path below `root` (default: the
+    longest root), in start order.
+
+    Walking back from a span's critical end, the child that finished last
+    before the cursor is on the path; the cursor then moves to that child's
+    start. A picked child's own walk starts from min(child end, cursor), so
+    grandchildren running after the child stopped being critical (or after the
+    parent finished) are not on the path.
+
+    Siblings are sorted by end time once for the whole tree, and each sibling
+    group is then scanned a single time; the walk itself is sequential, since
+    every pick depends on the previous cursor.
+    """
+    start, end = tree['start'], tree['end']
+    if root is None:
+        if len(tree['roots']) == 0:
+            return []
+        roots = tree['roots']
+        root = int(roots[np.argmax(end[roots] - start[roots])])
+
+    # same CSR layout as child_idx, but siblings in descending end order
+    child_idx = tree['child_idx']
+    by_end = child_idx[np.lexsort((-end[child_idx], tree['parent'][child_idx]))]
+    child_ptr = tree['child_ptr']
+
+    path = []
+    stack = [(root, end[root])]
+    while stack:
+        i, limit = stack.pop()
+        path.append(i)
+        cursor = limit
+        for c in by_end[child_ptr[i]:child_ptr[i + 1]]:
+            if cursor <= start[i]:
+                break
+            if start[c] >= cursor:
+                continue
+            # descending end order: the first live child has the latest clipped end
+            stack.append((int(c), min(end[c], cursor)))
+            cursor = start[c]
+    return sorted(path, key=lambda i: (start[i], tree['depth'][i]))
+
+
+def sibling_sweep(tree):
+    """
+    Sweep start/end events of every sibling group in one vectorized pass.
+
+    Child intervals are clipped to their parent's interval where the parent is
+    in the trace. Returns (peak, blocking, busy):
+      - peak: {parent_key: max number of siblings running at once, at least 1}
+      - blocking: per-span array of time during which the span was the only
+        running child, i.e. the parent was blocked on it alone.
+      - busy: per-span array of the clipped child interval length (0 for
+        spans without a parent reference).
+    Touching intervals (a.end == b.start) do not count as concurrent.
+    """
+    n = len(tree['span_ids'])
+    blocking = np.zeros(n, dtype=float)
+    busy = np.zeros(n, dtype=float)
+    kids = np.flatnonzero(tree['parent_key'] >= 0)
+    if len(kids) == 0:
+        return {}, blocking, busy
+
+    s = tree['start'][kids]
+    e = tree['end'][kids]
+    par = tree['parent'][kids]
+    known = par >= 0
+    s[known] = np.maximum(s[known], tree['start'][par[known]])
+    e[known] = np.minimum(e[known], tree['end'][par[known]])
+    e = np.maximum(e, s)
+    busy[kids] = e - s
+
+    group = np.concatenate([tree['parent_key'][kids]] * 2)
+    times = np.concatenate([s, e])
+    delta = np.concatenate([np.ones(len(kids), dtype=np.int64),
+                            -np.ones(len(kids), dtype=np.int64)])
+    who = np.concatenate([kids, kids])
+    # ends sort before starts at equal times
+    ev = np.lexsort((delta, times, group))
+    group, times, delta, who = group[ev], times[ev], delta[ev], who[ev]
+
+    first = np.flatnonzero(np.r_[True, group[1:] != group[:-1]])
+    # every group has matching +1/-1 events, so the global running sums are
+    # already back to 0 at each group boundary and need no per-group rebasing
+    running = np.cumsum(delta)
+    # sum of running span indices: equals the lone runner when running == 1
+    running_ids = np.cumsum(delta * who)
+
+    # a zero-length child's end sorts before its own start, so a group of
+    # only empty intervals would peak at 0; every group has at least one child
+    peaks = np.maximum(np.maximum.reduceat(running, first), 1)
+    peak = dict(zip(group[first].tolist(), peaks.tolist()))
+
+    gap = np.diff(times)
+    alone = (running[:-1] == 1) & (group[1:] == group[:-1]) & (gap > 0)
+    np.add.at(blocking, running_ids[:-1][alone], gap[alone])
+    return peak, blocking, busy
+
+
+def analyze_trace(spans):
+    """Per-trace summary: critical path ops, peak sibling concurrency and blocking time."""
+    tree = build_trace_tree(spans)
+    peak, blocking, busy = sibling_sweep(tree)
+    path = critical_path(tree)
+    return {
+        'tree':          tree,
+        'critical_path': [tree['ops'][i] for i in path],
+        'peak':          peak,
+        'blocking':      blocking,
+        'busy':          busy,
+    }
+
+
+def analyze_traces(trace_dir):
+    """
+    Aggregate tree analyses over every trace file in `trace_dir`.
+
+    Results are keyed by operation name:
+      - blocking: total time the op ran as its parent's only child
+      - busy: total time the op ran as a child, clipped to its parent the
+        same way as blocking. Spans without a parent reference contribute
+        nothing; spans whose parent is missing from the trace count unclipped.
+      - critical: number of traces where the op is on the critical path of
+        the trace's longest root (other roots of multi-root traces are ignored)
+      - peak: distribution of peak sibling concurrency under parents of that op
+    An op with high blocking close to busy sits in a sequential chain and is a
+    candidate for parallelizing with its siblings.
+    """
+    stats = defaultdict(lambda: {'blocking': 0.0, 'busy': 0.0, 'critical': 0,
+                                 'peak': defaultdict(int)})
+
+    for fname in tqdm(os.listdir(trace_dir), desc="Indexing trace trees"):
+        if not fname.endswith('.json'):
+            continue
+        path = os.path.join(trace_dir, fname)
+        try:
+            content = json.load(open(path))
+        except Exception:
+            continue
+
+        if isinstance(content, dict) and "data" in content:
+            traces = content["data"]
+        elif isinstance(content, list):
+            traces = content
+        else:
+            traces = [content]
+
+        for trace in traces:
+            spans = trace.get("spans", trace if isinstance(trace, list) else [])
+            result = analyze_trace(spans)
+            tree = result['tree']
+            ops = tree['ops']
+
+            for i in np.flatnonzero(tree['parent_key'] >= 0):
+                stats[ops[i]]['blocking'] += float(result['blocking'][i])
+                stats[ops[i]]['busy'] += float(result['busy'][i])
+            for op in set(result['critical_path']):
+                stats[op]['critical'] += 1
+            parent_op = {}
+            for i, k in zip(tree['parent'], tree['parent_key']):
+                if i >= 0:
+                    parent_op[k] = ops[i]
+            for k, p in result['peak'].items():
+                if k in parent_op:
+                    stats[parent_op[k]]['peak'][p] += 1
+
+    return {op: dict(s, peak=dict(s['peak'])) for op, s in stats.items()}
+
+
+def save_tree_stats(stats, output_file):
+    """Write per-op tree stats, ops that block their parent the longest first."""
+    with open(output_file, 'w') as f:
+        for op, info in sorted(stats.items(), key=lambda x: -x[1]['blocking']):
+            share = info['blocking'] / info['busy'] if info['busy'] else 0.0
+            f.write(f"{op}\n")
+            f.write(f"    blocking: {info['blocking']:.0f} ({share:.2%} of busy time)\n")
+            f.write(f"    critical_path_traces: {info['critical']}\n")
+            f.write(f"    peak_children_concurrency: {dict(sorted(info['peak'].items()))}\n")
+            f.write("\n")
+
+
+if __name__ == "__main__":
+    trace_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "normal")
+    stats = analyze_traces(trace_dir)
+    output_txt = "trace_tree_stats.txt"
+    save_tree_stats(stats, output_txt)
+    print(f"Wrote trace tree stats to {output_txt}")